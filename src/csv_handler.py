@@ -1,10 +1,21 @@
 import csv
 import logging
+from functools import lru_cache
+from dataclasses import fields
+from operator import attrgetter, itemgetter
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Tuple
 from datetime import datetime
+from utils import Analysis, FILE_RECORD_FIELDS
+
+ANALYSIS_ATTRIBUTES = [field.name for field in fields(Analysis)]
+# CSV header in Analysis field order, risk_score keeps its original 'risk score' column name
+ANALYSIS_FIELDS = ['risk score' if name == 'risk_score' else name for name in ANALYSIS_ATTRIBUTES]
+analysis_row = attrgetter(*ANALYSIS_ATTRIBUTES)
 
 class CSVHandler:
+    _ensured_directories = set()
+
     def __init__(self, input_dir: str = "data/input", output_dir: str = "data/output"):
         """
         Initialize CSV handler with input and output directory paths.
@@ -19,19 +30,20 @@ class CSVHandler:
         self.ensure_directories()
 
     def setup_logging(self):
-        """Configure logging for the CSV handler."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger('CSVHandler')
+        """Get the logger for the CSV handler."""
+        self.logger = logging.getLogger(self.__class__.__name__)
 
     def ensure_directories(self):
         """Create input and output directories if they don't exist."""
-        self.input_dir.mkdir(parents=True, exist_ok=True)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for directory in (self.input_dir, self.output_dir):
+            # Directories already created by an earlier handler are skipped, keyed on the
+            # absolute path since relative ones move with the working directory
+            absolute_directory = directory.resolve()
+            if absolute_directory not in CSVHandler._ensured_directories:
+                absolute_directory.mkdir(parents=True, exist_ok=True)
+                CSVHandler._ensured_directories.add(absolute_directory)
 
-    def read_file_summaries(self, filename: str) -> List[str]:
+    def read_file_summaries(self, filename: str) -> List[List[Tuple[str, ...]]]:
         """
         Read file addresses from a CSV file.
 
@@ -42,74 +54,55 @@ class CSVHandler:
             filename: Name of the CSV file in the input directory
             
         Returns:
-            List of file addresses
+            Groups of file records, each record holding the values of FILE_RECORD_FIELDS
         """
         file_path = self.input_dir / filename
-        summary_list = []
-        
+
         try:
-            file_batch_content = []
-            previous_path = ""
-            with open(file_path, 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                # Check if 'file' column exists
-                if 'Path' not in reader.fieldnames:
+            summary_list = []
+            previous_path = None
+            previous_key = None
+            # Read in 1 MiB chunks, utf-8-sig also drops the BOM Procmon writes
+            with open(file_path, 'r', newline='', encoding='utf-8-sig', buffering=1 << 20) as csvfile:
+                reader = csv.reader(csvfile)
+                header = next(reader, [])
+                column_index = {name: i for i, name in enumerate(header)}
+                # Check if 'Path' column exists
+                if 'Path' not in column_index:
                     raise ValueError("CSV file must contain 'Path' column")
-                
-                
+
+                # Look the column positions up once instead of once per row
+                path_index = column_index['Path']
+                field_indexes = [column_index[field] for field in FILE_RECORD_FIELDS[:-1]]
+                get_fields = itemgetter(*field_indexes)
+                last_index = max(field_indexes + [path_index])
+
                 for row in reader:
-                    file_path = row['Path'].strip()
-                    if not file_path:
-                        continue
-                    if "\\" not in file_path:
+                    # Skip blank lines, and short rows such as the tail of an interrupted export
+                    if len(row) <= last_index:
+                        if row:
+                            self.logger.warning(f"Skipping incomplete row on line {reader.line_num} of {filename}")
                         continue
-                    
-                    file_time = row['File Time']
-                    total_events = row['Total Events']
-                    opens = row['Opens']
-                    closes = row['Closes']
-                    reads = row['Reads']
-                    writes = row['Writes']
-                    read_bytes = row['Read Bytes']
-                    wirte_bytes = row['Write Bytes']
-                    get_acl = row['Get ACL']
-                    set_acl = row['Set ACL']
-                    other = row['Other']
-                    file_record = [f"File Time: {file_time}", f"Total Events: {total_events}", f"Opens: {opens}",
-                                               f"Closes: {closes}", f"Reads: {reads}", f"Writes: {writes}", f"Read Bytes: {read_bytes}",
-                                               f"Write Bytes: {wirte_bytes}", f"Get ACL: {get_acl}", f"Set ACL: {set_acl}", f"Other: {other}",
-                                               f"Path: {file_path}"]
-                    
-                    if not previous_path:
-                        file_batch_content.append(file_record)
-                        previous_path = file_path
-                        continue
-                    file_tree = file_path.split("\\")
-                    file_tree_levels_count = float(len(file_tree))
-                    # GROUPING Of SIMALIAR Paths IMPORTANT THAT THINGS ARE ORGANIZED ACCORDING TO PATH.
-                    if file_tree_levels_count / 2 > 1:
-                        dir_level_grouping = int(round(file_tree_levels_count/2,0))
-                        folder_group = file_tree[dir_level_grouping] # Not going to deep into file trees.
-                        # If the folder is not in the prvious path then
-                        if folder_group not in previous_path:
-                            summary_list.append(file_batch_content) # Add to summary list as group. 
-                            file_batch_content = [] # Start a new group
-                            file_batch_content.append(file_record) # Append the current record to the new group
-                            previous_path = file_path # Update the previous path
+                    path = row[path_index].strip()
+
+                    # Procmon lists the same path on consecutive rows, those share the group already worked out
+                    if path != previous_path:
+                        separator_count = path.count("\\")
+                        if not separator_count:
                             continue
-                        file_batch_content.append(file_record)
-                        previous_path = file_path
-                        continue
-                    folder_group = file_tree[1] # This is Hight level folder
-                    if folder_group not in previous_path:
-                        summary_list.append(file_batch_content)
-                        file_batch_content = []
-                        file_batch_content.append(file_record)
-                        previous_path = file_path
-                        continue
-                    file_batch_content.append(file_record)
-                    previous_path = file_path
-        
+
+                        # GROUPING Of SIMALIAR Paths IMPORTANT THAT THINGS ARE ORGANIZED ACCORDING TO PATH.
+                        group_key = self._group_key(path, separator_count)
+                        # A new group starts whenever the grouping folder changes
+                        if group_key != previous_key:
+                            file_batch_content = []
+                            summary_list.append(file_batch_content)
+                            previous_key = group_key
+                        previous_path = path
+
+                    # Keep the raw values, the "Field: value" text is only built when sent to Gemini
+                    file_batch_content.append(get_fields(row) + (path,))
+
             self.logger.info(f"Successfully read {len(summary_list)} files from {filename}")
             return summary_list
             
@@ -117,12 +110,39 @@ class CSVHandler:
             self.logger.error(f"Error reading file list from {filename}: {str(e)}")
             raise
 
-    def write_analysis_results(self, results: List[Dict]) -> str:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _group_key(file_path: str, separator_count: int) -> tuple:
+        """
+        Get the grouping key of a file path.
+
+        Paths are grouped on the folder halfway down their tree, or on the
+        high level folder for shallow paths. The key is the path up to and
+        including that folder so equal folder names in different trees do
+        not end up in the same group.
+
+        Args:
+            file_path: Windows style file path
+            separator_count: Number of backslashes in file_path
+
+        Returns:
+            Tuple of path components up to the grouping folder
+        """
+        file_tree_levels_count = separator_count + 1
+        if file_tree_levels_count > 2:
+            dir_level_grouping = round(file_tree_levels_count / 2) # Not going to deep into file trees.
+        else:
+            dir_level_grouping = 1 # This is Hight level folder
+        # Only split as far as the grouping folder, the rest of the path is not needed
+        file_tree = file_path.split("\\", dir_level_grouping + 1)
+        return tuple(file_tree[:dir_level_grouping + 1])
+
+    def write_analysis_results(self, results: List[Analysis]) -> str:
         """
         Write analysis results to a CSV file.
         
         Args:
-            results: List of dictionaries containing file analysis results
+            results: List of file analysis results
             
         Returns:
             Path to the created CSV file
@@ -130,39 +150,17 @@ class CSVHandler:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"file_analysis_{timestamp}.csv"
         output_path = self.output_dir / output_filename
-        file = open("errors", "a")
         try:
-            # Get all unique fields from all results
-            fieldnames = set()
-            for result in results:
-                try:
-                    fieldnames.update(result.keys())
-                except Exception as e:
-                    file.write(str(result) +"\n")
+            # 1 MiB write buffer so the OS sees few large writes
+            with open(output_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(ANALYSIS_FIELDS)
 
-            
-            # Convert sets or lists in results to strings for CSV writing
-            processed_results = []
-            for result in results:
-                processed_result = {}
-                try:
-                    result.items()
-                except Exception:
-                    continue
-                for key, value in result.items():
-                    try:
-                        if isinstance(value, (list, set)):
-                            processed_result[key] = ', '.join(map(str, value))
-                        else:
-                            processed_result[key] = value
-                        processed_results.append(processed_result)
-                    except Exception:
-                        pass
-
-            with open(output_path, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=sorted(fieldnames))
-                writer.writeheader()
-                writer.writerows(processed_results)
+                for result in results:
+                    if not isinstance(result, Analysis):
+                        self.logger.warning(f"Skipping result that is not an analysis: {result}")
+                        continue
+                    writer.writerow(analysis_row(result))
 
             self.logger.info(f"Successfully wrote analysis results to {output_filename}")
             return str(output_path)
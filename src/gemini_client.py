@@ -1,6 +1,23 @@
 import logging
+import re
 import google.generativeai as genai
-from typing import Dict, Optional
+from typing import List, Optional, Tuple
+from utils import Analysis, format_file_record
+
+FIELD_MAP = {
+    'path': 'path',
+    'trustworthiness': 'trustworthiness',
+    'primary purpose': 'primary_purpose',
+    'security concerns': 'security_concerns',
+    'risk score': 'risk_score',
+    'recommendation': 'recommendation'
+}
+# Field lines may carry list or markdown markup, e.g. "1. Path:", "- Path:" or "**Path:**"
+FIELD_PATTERN = re.compile(
+    r'^[ \t]*[-*#>\d. \t]*\**(' + '|'.join(FIELD_MAP) + r')\**[ \t]*:\**[ \t]*(.*?)[ \t\r]*$',
+    re.M | re.I
+)
+RESULT_MARKER = re.compile(r'^\s*=== RESULT (\d+) ===\s*$', re.M)
 
 class GeminiClient:
     def __init__(self, api_key: str):
@@ -17,12 +34,8 @@ class GeminiClient:
 
 
     def setup_logging(self):
-        """Configure logging for the Gemini client."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger('GeminiClient')
+        """Get the logger for the Gemini client."""
+        self.logger = logging.getLogger(self.__class__.__name__)
 
     def connect(self) -> bool:
         """Establish connection to Gemini API."""
@@ -35,24 +48,40 @@ class GeminiClient:
             self.logger.error(f"Failed to connect to Gemini API: {str(e)}")
             return False
 
-    def analyze_files_data(self, file_records_list) -> Optional[Dict]:
+    async def analyze_files_data(self, file_records_list) -> Optional[List[Analysis]]:
         """
-        Analyze IP data using Gemini AI.
+        Analyze a single group of file records using Gemini AI.
         
         Args:
-            ip_data: Dictionary containing IP information from Censys
+            file_records_list: List of file records sharing a path group
             
         Returns:
-            Dictionary containing AI analysis results
+            List of Analysis results for the group
+        """
+        results = await self.analyze_files_data_batch([file_records_list])
+        return results[0] if results is not None else None
+
+    async def analyze_files_data_batch(self, groups: List[List[Tuple[str, ...]]]) -> Optional[List[List[Analysis]]]:
+        """
+        Analyze several groups of file records with a single Gemini request.
+        
+        Args:
+            groups: List of file record groups as returned by the CSV handler
+            
+        Returns:
+            One list of Analysis results per group, in input order
         """
         try:
-            # Format the IP data for analysis
+            input_sections = "\n".join(
+                f"=== GROUP {i} ===\n" + "\n".join([format_file_record(file_record) for file_record in file_records_list])
+                for i, file_records_list in enumerate(groups)
+            )
 
             prompt = f"""
             You are an expert Cybersecurity Analyst specializing in file behavior analysis and threat detection.
             
-            INPUT DATA IN PYTHON LIST FORMAT:
-            {file_records_list}
+            INPUT DATA, ONE FILE RECORD PER LINE WITH FIELDS SEPARATED BY |, SPLIT INTO {len(groups)} NUMBERED GROUPS:
+            {input_sections}
 
             ANALYSIS REQUIREMENTS:
             Provide a security assessment of each file path in the INPUT DATA above in the following strict format:
@@ -74,11 +103,12 @@ class GeminiClient:
             6. Use hyphens instead of commas or periods for separation
             7. Ensure each field has exactly one colon followed by a space
             8. Do not include any additional formatting or explanations
+            9. Start the assessments of each group with a line === RESULT <group number> === matching its === GROUP <group number> === line
 
             ANALYSIS GUIDELINES:
             - Base Trustworthiness score on:
             * Known file reputation and what it is usually used for.
-            * Other files that are also in the INPUT DATA which is also active.
+            * Other files that are also in the same group of the INPUT DATA which is also active.
             * Location of the file
             * Communication patterns
             * Data volume ratios
@@ -91,20 +121,52 @@ class GeminiClient:
             - No extra whitespace
             - No additional formatting
             """
-            response = self.modle.generate_content(prompt)
+            response = await self.modle.generate_content_async(prompt)
             analysis = response.text
 
-            # Parse the analysis into structured fields
-            analysis_dict = self._parse_analysis(analysis)
-        
-
-            return analysis_dict
+            # Parse the analysis of every group into structured fields
+            return self._split_results(analysis, len(groups))
 
         except Exception as e:
-            self.logger.error(f"Error analyzing file {file_records_list}")
+            self.logger.error(f"Error analyzing {len(groups)} file groups starting at {groups[0][0][-1]}: {str(e)}")
             return None
 
-    def _parse_analysis(self, analysis: str) -> Dict:
+    def _split_results(self, analysis: str, group_count: int) -> List[List[Analysis]]:
+        """
+        Split a batched Gemini response into the analysis of each group.
+        
+        Args:
+            analysis: Raw analysis text from Gemini
+            group_count: Number of groups sent in the request
+            
+        Returns:
+            One list of parsed analyses per group
+        """
+        results = [[] for _ in range(group_count)]
+        segments = RESULT_MARKER.split(analysis)
+        # Without any markers the whole response belongs to the first group
+        if len(segments) == 1:
+            if group_count > 1:
+                self.logger.warning(f"No result markers in response for {group_count} groups, keeping it as one group")
+            results[0] = self._parse_analysis(analysis)
+            return results
+
+        # segments is [preamble, index, text, index, text, ...]
+        marker_count = len(segments) // 2
+        if marker_count != group_count:
+            self.logger.warning(f"Response has {marker_count} result markers for {group_count} groups")
+        # Assessments before the first marker, e.g. a missing === RESULT 0 === line, belong to the first group
+        results[0].extend(self._parse_analysis(segments[0]))
+        for index, segment in zip(segments[1::2], segments[2::2]):
+            group_index = int(index)
+            # Out of range sections, e.g. groups numbered from 1, are kept with the last group
+            if group_index >= group_count:
+                self.logger.warning(f"Result marker {group_index} is out of range for {group_count} groups")
+                group_index = group_count - 1
+            results[group_index].extend(self._parse_analysis(segment))
+        return results
+
+    def _parse_analysis(self, analysis: str) -> List[Analysis]:
         """
         Parse Gemini's analysis into structured fields.
         
@@ -112,53 +174,18 @@ class GeminiClient:
             analysis: Raw analysis text from Gemini
             
         Returns:
-            Dictionary containing parsed analysis fields
+            List of parsed analyses
         """
-        # Initialize default values
-        parsed = {
-            'path': '',
-            'trustworthiness': '',
-            'primary_purpose': '',
-            'security_concerns': '',
-            'risk score': '',
-            'recommendation': ''
-        }
-
-        parsed_dictionaries = []
-
-        # Simple parsing based on field markers
-        current_field = None
-        for line in analysis.split('\n'):
-            line = line.strip()
-            lower_line = line.lower()
-
-            if 'path' in lower_line and ':' in line:
-                current_field = 'path'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-            elif 'trustworthiness' in lower_line and ':' in line:
-                current_field = 'trustworthiness'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-            elif 'primary purpose' in lower_line and ':' in line:
-                current_field = 'primary_purpose'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-            elif 'security concerns' in lower_line and ':' in line:
-                current_field = 'security_concerns'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-            elif 'risk score' in lower_line and ':' in line:
-                current_field = 'risk score'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-            elif 'recommendation' in lower_line and ':' in line:
-                current_field = 'recommendation'
-                parsed[current_field] = line.split(':', 1)[1].strip()
-                parsed_dictionaries.append(parsed)
-                parsed = {
-                    'path': '',
-                    'trustworthiness': '',
-                    'primary_purpose': '',
-                    'security_concerns': '',
-                    'risk score': '',
-                    'recommendation': ''
-                }
-
-
-        return parsed_dictionaries
\ No newline at end of file
+        parsed = Analysis()
+        parsed_analyses = []
+
+        # One regex sweep over the whole response picks out every field line
+        for match in FIELD_PATTERN.finditer(analysis):
+            field = FIELD_MAP[match.group(1).lower()]
+            setattr(parsed, field, match.group(2))
+            # Recommendation is the last field of every assessment
+            if field == 'recommendation':
+                parsed_analyses.append(parsed)
+                parsed = Analysis()
+
+        return parsed_analyses
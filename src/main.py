@@ -1,11 +1,21 @@
 import logging
-from typing import List, Dict
+from typing import List, Tuple
 from csv_handler import CSVHandler
 from gemini_client import GeminiClient
 from config import ConfigHandler
+import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from utils import progress_tracker
+from itertools import islice
+from aiolimiter import AsyncLimiter
+from utils import Analysis, progress_tracker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+PROGRESS_INTERVAL = 0.5
+REQUESTS_PER_MINUTE = 15 # gemini-1.5-flash requests per minute quota
 
 class FileIntelAnalyzer:
     def __init__(self):
@@ -16,12 +26,8 @@ class FileIntelAnalyzer:
         self.initialize_clients()
 
     def setup_logging(self):
-        """Configure logging for the main program."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger('IPIntelAnalyzer')
+        """Get the logger for the main program."""
+        self.logger = logging.getLogger(self.__class__.__name__)
 
     def initialize_clients(self) -> bool:
         """Initialize all API clients."""
@@ -46,44 +52,68 @@ class FileIntelAnalyzer:
         return True
     
 
-    def process_file_batch(self, file_records: List[List[str]]) -> Dict:
-        """Process a single IP address through both APIs."""
-        # Get IP data
-        
-       
-        final_data = self.gemini_client.analyze_files_data(file_records)
-
-        time.sleep(5)
-        return final_data
-
-    def process_file_summary_lists(self, file_summaries_list: List[List[List[str]]], max_workers: int = 1) -> List[Dict]:
-        """Process a list of IPs concurrently.
-        [[[..., Path: ], [...Path: ]], [[..., Path: ], [...Path: ]]]
+    async def process_file_batch(self, file_batches: List[List[Tuple[str, ...]]], limiter: AsyncLimiter,
+                                 semaphore: asyncio.Semaphore) -> List[List[Analysis]]:
+        """Analyze a batch of file groups with a single Gemini request."""
+        # Only wait when the requests per minute budget is used up
+        async with limiter:
+            async with semaphore:
+                return await self.gemini_client.analyze_files_data_batch(file_batches)
+
+    def process_file_summary_lists(self, file_summaries_list: List[List[Tuple[str, ...]]], max_workers: int = 1,
+                                   batch_size: int = 5) -> List[Analysis]:
+        """Process a list of file groups concurrently, batch_size groups per request.
+        [[(..., Path), (..., Path)], [(..., Path), (..., Path)]]
         """
-        # Progress tracing
+        return asyncio.run(self._process_file_summary_lists(file_summaries_list, max_workers, batch_size))
+
+    async def _process_file_summary_lists(self, file_summaries_list: List[List[Tuple[str, ...]]], max_workers: int,
+                                          batch_size: int) -> List[Analysis]:
+        """Run the Gemini requests with at most max_workers in flight, limited to the requests per minute."""
+        # Progress tracing, reported at most every PROGRESS_INTERVAL seconds
         done = 0
-        progress_tracker(len(file_summaries_list), done)
+        total = len(file_summaries_list)
+        progress_tracker(total, done)
+        next_progress_update = time.monotonic() + PROGRESS_INTERVAL
+
+        # Sort the groups on their first path so each batch holds neighbouring folders
+        file_summaries_list = sorted(file_summaries_list, key=lambda file_group: file_group[0][-1])
+        batches = (file_summaries_list[i:i + batch_size] for i in range(0, len(file_summaries_list), batch_size))
+        limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+        semaphore = asyncio.Semaphore(max_workers)
 
         # Actual function
         results = []
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_ip = {executor.submit(self.process_file_batch, files_batch): files_batch 
-                          for files_batch in file_summaries_list}
-            
-            for future in as_completed(future_to_ip):
-                file_summary = future_to_ip[future]
+        # Only max_workers * 2 batches are in flight, the next one is started as each finishes
+        task_to_batch = {asyncio.create_task(self.process_file_batch(files_batch, limiter, semaphore)): files_batch
+                         for files_batch in islice(batches, max_workers * 2)}
+        while task_to_batch:
+            finished, _ = await asyncio.wait(task_to_batch, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                file_summaries = task_to_batch.pop(task)
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    task_to_batch[asyncio.create_task(self.process_file_batch(next_batch, limiter, semaphore))] = next_batch
                 try:
-                    result = future.result()
-                    for path_summary in result:
-                        results.append(path_summary)
-                    self.logger.info(f"Completed analysis for File: {file_summary}")
+                    result = task.result()
+                    if result is None:
+                        # The Gemini client has already logged why the request failed
+                        self.logger.error(f"No analysis returned for {len(file_summaries)} file groups")
+                        results.extend(file_summaries)
+                    else:
+                        for group_result in result:
+                            for path_summary in group_result:
+                                results.append(path_summary)
+                        self.logger.info(f"Completed analysis for Files: {file_summaries}")
                 except Exception as e:
-                    self.logger.error(f"Error processing File {file_summary}: {str(e)}")
+                    self.logger.error(f"Error processing Files {file_summaries}: {str(e)}")
+
+                    results.extend(file_summaries)
+                done += len(file_summaries)
+                if done == total or time.monotonic() >= next_progress_update:
+                    progress_tracker(total, done)
+                    next_progress_update = time.monotonic() + PROGRESS_INTERVAL
 
-                    results.append(file_summary)
-                done += 1
-                progress_tracker(len(file_summaries_list), done)
-        
         return results
 
     def run_analysis(self, input_filename: str) -> str:
@@ -1,3 +1,27 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+FILE_RECORD_FIELDS = ("File Time", "Total Events", "Opens", "Closes", "Reads", "Writes",
+                      "Read Bytes", "Write Bytes", "Get ACL", "Set ACL", "Other", "Path")
+FILE_RECORD_LABELS = tuple(f"{field}: " for field in FILE_RECORD_FIELDS)
+
+
 def progress_tracker(total:int, done:int):
     persentage_done = round(done/total*100, 2)
-    print(f"{str(done)} out of {str(total)} done. Completed: {persentage_done}%")
\ No newline at end of file
+    print(f"{str(done)} out of {str(total)} done. Completed: {persentage_done}%")
+
+
+def format_file_record(file_record: Tuple[str, ...]) -> str:
+    """Turn a file record of FILE_RECORD_FIELDS values into one "Field: value | Field: value" line."""
+    return " | ".join([label + value for label, value in zip(FILE_RECORD_LABELS, file_record)])
+
+
+@dataclass(slots=True)
+class Analysis:
+    """Security assessment of a single file path as parsed from Gemini."""
+    path: str = ''
+    trustworthiness: str = ''
+    primary_purpose: str = ''
+    security_concerns: str = ''
+    risk_score: str = ''
+    recommendation: str = ''